@@ -1,118 +1,508 @@
+import io
 import os
-import psycopg2
+import re
+import queue
+import threading
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
 import tkinter as tk
-from tkinter import ttk, messagebox
-import json
+from tkinter import ttk, messagebox, font as tkfont
+import pickle
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque, namedtuple
+from sys import intern
 
 # Database configuration
 DB_NAME = "files"        # Replace with your database name
 DB_USER = "luke"         # Replace with your username
 DB_HOST = "localhost"    # Replace with your host
-CACHE_FILE = "cache.json"  # Cache file path
+DB_CONNECT_TIMEOUT = 5   # Seconds to wait before treating the database as unreachable
+CACHE_FILE = "cache.pickle.z"  # Cache file path
+CACHE_VERSION = 4  # Bump when the layout of the cached data changes
+
+# Size of the MD5 digests the indexer stores as hex
+DIGEST_SIZE = 16
+
+# Relative drift in the planner's row estimate that still counts as unchanged
+ROW_COUNT_TOLERANCE = 0.01
+
+# Backslash escapes used by COPY's text format
+COPY_ESCAPES = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+COPY_ESCAPE_PATTERN = re.compile(r"\\(.)", re.DOTALL)
+
+# How often the Tk event loop checks for results from background work
+QUEUE_POLL_MS = 50
 
 # Tag for files with no duplicates
 SINGLE_TAG = "single"
 
+# Tcl procedure that inserts a batch of sibling items into a Treeview in one call from
+# Python. items is a flat list of text, hash, tags and is_folder for each item; folders
+# get a placeholder child so they can be expanded. Returns the new item ids.
+INSERT_ITEMS_PROC = "fileindexer_insert_items"
+INSERT_ITEMS_SCRIPT = """
+proc fileindexer_insert_items {treeview parent items} {
+    set ids {}
+    foreach {text hash tags is_folder} $items {
+        set id [$treeview insert $parent end -text $text -values [list $hash] -tags $tags]
+        if {$is_folder} {
+            $treeview insert $id end -text {}
+        }
+        lappend ids $id
+    }
+    return $ids
+}
+"""
+
+# Flat file tree produced by build_tree
+FileTree = namedtuple("FileTree", ["names", "parent_idx", "first_child", "child_end", "highlighted"])
+
+# Held while the cache file is being written
+_CACHE_LOCK = threading.Lock()
+
+# Pooled connections, created on first use
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_db_pool():
+    """Get the shared connection pool, creating it using environment variables."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            db_password = os.environ.get("DB_PASSWORD")
+            if not db_password:
+                raise ValueError("Database password not set. Please set the DB_PASSWORD environment variable.")
+
+            _POOL = ThreadedConnectionPool(
+                1,
+                8,
+                dbname=DB_NAME,
+                user=DB_USER,
+                password=db_password,
+                host=DB_HOST,
+                connect_timeout=DB_CONNECT_TIMEOUT
+            )
+        return _POOL
+
+@contextmanager
 def get_db_connection():
-    """Get a database connection using environment variables."""
-    db_password = os.environ.get("DB_PASSWORD")
-    if not db_password:
-        raise ValueError("Database password not set. Please set the DB_PASSWORD environment variable.")
-    
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=db_password,
-        host=DB_HOST
-    )
+    """Borrow a connection from the pool.
 
-def fetch_file_paths():
-    """Fetch all file paths from the database."""
+    Connections are in autocommit mode. Every query here is a single read, so this saves
+    the BEGIN and COMMIT round-trips psycopg2 would otherwise send around each one.
+    """
+    pool = get_db_pool()
+    connection = pool.getconn()
     try:
-        with get_db_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT filepath FROM file_hashes;")
-                file_paths = cursor.fetchall()
-                return [row[0] for row in file_paths]
-    except Exception as e:
-        messagebox.showerror("Database Error", f"Error: {e}")
-        return []
-
-def fetch_file_hash_counts():
-    """Fetch the counts of files grouped by their hash."""
-    try:
-        with get_db_connection() as connection:
-            with connection.cursor() as cursor:
-                query = """
-                SELECT hash, COUNT(*) AS file_count
-                FROM file_hashes
-                GROUP BY hash;
-                """
-                cursor.execute(query)
-                hash_counts = cursor.fetchall()
-                return {row[0]: row[1] for row in hash_counts}
-    except Exception as e:
-        messagebox.showerror("Database Error", f"Error: {e}")
-        return {}
+        connection.autocommit = True
+        yield connection
+    finally:
+        pool.putconn(connection)
+
+def close_db_pool():
+    """Close all pooled connections."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.closeall()
+            _POOL = None
+
+def unescape_copy_field(field):
+    """Undo the backslash escapes COPY's text format applies to a field."""
+    if "\\" not in field:
+        return field
+    return COPY_ESCAPE_PATTERN.sub(lambda match: COPY_ESCAPES.get(match.group(1), match.group(1)), field)
+
+class FileHashIndex:
+    """File paths and their hashes, stored compactly.
+
+    Paths are kept in a sorted list and found by binary search. Hashes are stored as raw
+    MD5 digests packed into one bytearray, in the same order as the paths, rather than as
+    a hex string per file. Files must be added in sorted order.
+    """
+    def __init__(self):
+        self.paths = []
+        self.digests = bytearray()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, path, file_hash):
+        """Append a file path and its hex hash, which must sort after every path so far."""
+        if self.paths and path <= self.paths[-1]:
+            raise ValueError(f"File paths must be added in sorted order: {path}")
+        digest = bytes.fromhex(file_hash)
+        if len(digest) != DIGEST_SIZE:
+            raise ValueError(f"Unexpected hash length for {path}: {file_hash}")
+        self.paths.append(path)
+        self.digests += digest
+
+    def digest(self, index):
+        """Get the raw digest of the file at the given position."""
+        return bytes(self.digests[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE])
+
+    def find(self, path):
+        """Get the position of a file path, or -1 if it is not indexed."""
+        index = bisect_left(self.paths, path)
+        if index < len(self.paths) and self.paths[index] == path:
+            return index
+        return -1
+
+    def get(self, path, default=None):
+        """Get the hash of a file path as a hex string."""
+        index = self.find(path)
+        return self.digest(index).hex() if index >= 0 else default
+
+    def count_digests(self):
+        """Count the files grouped by their digest."""
+        return Counter(self.digest(index) for index in range(len(self.paths)))
+
+class FileHashCopyReader(io.TextIOBase):
+    """Target for COPY ... TO STDOUT of file paths and hashes that adds rows as they arrive.
+
+    psycopg2 decodes the COPY data for text file objects and calls write() as it is
+    received, so the rows go straight into a FileHashIndex and the table is never held
+    in memory as a whole.
+    """
+    def __init__(self):
+        self.file_hash_index = FileHashIndex()
+        self.partial_line = ""
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        lines = (self.partial_line + data).split("\n")
+        self.partial_line = lines.pop()
+        for line in lines:
+            file_path, file_hash = line.split("\t")
+            self.file_hash_index.add(unescape_copy_field(file_path), file_hash)
+        return len(data)
+
+def fetch_all():
+    """Fetch every file path and hash in a single pass over the database.
+
+    Returns a FileHashIndex of the files and the counts of files grouped by their digest.
+    """
+    # COPY skips per-row result parsing, which is much faster for the whole table. The C
+    # collation orders paths the same way Python compares strings, as FileHashIndex needs.
+    query = 'COPY (SELECT filepath, hash FROM file_hashes ORDER BY filepath COLLATE "C") TO STDOUT'
+    reader = FileHashCopyReader()
+    with get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(query, reader)
+
+    file_hash_index = reader.file_hash_index
+    return file_hash_index, dict(file_hash_index.count_digests())
+
+def fetch_table_stats():
+    """Fetch cheap statistics that change when file_hashes changes.
+
+    Returns the planner's estimate of the number of rows and the number of rows
+    inserted, updated or deleted since statistics were last reset.
+    """
+    with get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            query = """
+            SELECT c.reltuples::bigint, s.n_tup_ins + s.n_tup_upd + s.n_tup_del
+            FROM pg_class c
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.oid = 'file_hashes'::regclass;
+            """
+            cursor.execute(query)
+            return cursor.fetchone()
 
 def fetch_files_with_same_hash(file_path):
     """Fetch files with the same hash as the given file."""
-    try:
-        with get_db_connection() as connection:
-            with connection.cursor() as cursor:
-                query = """
-                SELECT f2.filepath
-                FROM file_hashes f1
-                JOIN file_hashes f2 ON f1.hash = f2.hash
-                WHERE f1.filepath = %s AND f1.filepath != f2.filepath;
-                """
-                cursor.execute(query, (file_path,))
-                files = cursor.fetchall()
-                return [row[0] for row in files]
-    except Exception as e:
-        messagebox.showerror("Database Error", f"Error: {e}")
-        return []
-
-def fetch_all_file_hashes():
-    """Fetch all file hashes from the database."""
-    try:
-        with get_db_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT filepath, hash FROM file_hashes;")
-                file_hashes = cursor.fetchall()
-                return {row[0]: row[1] for row in file_hashes}
-    except Exception as e:
-        messagebox.showerror("Database Error", f"Error: {e}")
-        return {}
-
-def build_tree(file_paths):
-    """Build a nested dictionary representing the file tree."""
-    tree = {}
-    for path in file_paths:
-        parts = path.strip('/').split('/')
-        node = tree
-        for part in parts[:-1]:
-            node = node.setdefault(part, {})
-        node[parts[-1]] = None  # Use None to represent a file
-    return tree
+    with get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            query = """
+            SELECT filepath
+            FROM file_hashes
+            WHERE hash = (SELECT hash FROM file_hashes WHERE filepath = %s)
+            AND filepath <> %s;
+            """
+            cursor.execute(query, (file_path, file_path))
+            files = cursor.fetchall()
+            return [row[0] for row in files]
+
+def build_tree(file_hash_index, file_hash_counts):
+    """Build a flat representation of the file tree.
+
+    Node 0 is the root. Nodes are numbered breadth-first, so the children of a folder
+    are the contiguous range first_child[i] to child_end[i]; files have a first_child
+    of -1. highlighted[i] is set for files with a unique hash and for every folder
+    that contains one.
+    """
+    # Interning lets every occurrence of a folder name share one string
+    entries = sorted(
+        ([intern(part) for part in path.strip('/').split('/')], index)
+        for index, path in enumerate(file_hash_index.paths)
+    )
+
+    names = [""]
+    parent_idx = array("i", [-1])
+    first_child = array("i", [-1])
+    child_end = array("i", [-1])
+    highlighted = bytearray(1)
+
+    # Folders waiting to be expanded, with the range of entries beneath them
+    pending = deque([(0, 0, 0, len(entries))])
+    while pending:
+        node, depth, start, end = pending.popleft()
+        first_child[node] = len(names)
+        i = start
+        while i < end:
+            name = entries[i][0][depth]
+            j = i + 1
+            while j < end and entries[j][0][depth] == name:
+                j += 1
+
+            child = len(names)
+            names.append(name)
+            parent_idx.append(node)
+            first_child.append(-1)
+            child_end.append(-1)
+            highlighted.append(0)
+
+            if len(entries[j - 1][0]) > depth + 1:
+                # Skip a file sharing the folder's name, which sorts ahead of its contents
+                while len(entries[i][0]) == depth + 1:
+                    i += 1
+                pending.append((child, depth + 1, i, j))
+            else:
+                digest = file_hash_index.digest(entries[i][1])
+                highlighted[child] = file_hash_counts.get(digest, 0) == 1
+            i = j
+        child_end[node] = len(names)
+
+    # Children always come after their parent, so one reverse pass marks every ancestor
+    for node in range(len(names) - 1, 0, -1):
+        if highlighted[node]:
+            highlighted[parent_idx[node]] = 1
+
+    return FileTree(names, parent_idx, first_child, child_end, highlighted)
+
+def find_unique_files(file_hash_index, file_hash_counts):
+    """Find the sorted paths of all files with only a single copy."""
+    return [
+        path for index, path in enumerate(file_hash_index.paths)
+        if file_hash_counts.get(file_hash_index.digest(index), 0) == 1
+    ]
 
 def load_cache():
-    """Load cached data from the cache file."""
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
+    """Load cached data from the cache file.
+
+    Returns None if there is no usable cache, so the data is fetched from the database.
+    """
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            cache = pickle.loads(zlib.decompress(f.read()))
+        # Ignore caches written in an older layout
+        if cache.get("version") == CACHE_VERSION:
+            return cache
+    except Exception:
+        # A missing, truncated or unreadable cache is just a cache miss
+        pass
     return None
 
 def save_cache(data):
-    """Save data to the cache file."""
-    with open(CACHE_FILE, "w") as f:
-        json.dump(data, f)
+    """Save data to the cache file.
+
+    The data is written to a temporary file that then replaces the cache, so an
+    interrupted save never leaves a truncated cache behind.
+    """
+    with _CACHE_LOCK:
+        compressed = zlib.compress(pickle.dumps({"version": CACHE_VERSION, **data}, protocol=5))
+        temp_file = CACHE_FILE + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(compressed)
+        os.replace(temp_file, CACHE_FILE)
+
+def is_cache_fresh(cache, table_stats):
+    """Check whether the cache was saved from the table as it is now."""
+    row_count_estimate, modification_count = table_stats
+    if cache.get("modification_count") != modification_count:
+        return False
+    # ANALYZE resamples the table, so the estimate can drift even when nothing changed
+    cached_estimate = cache.get("row_count_estimate")
+    if cached_estimate is None:
+        return False
+    return abs(row_count_estimate - cached_estimate) <= ROW_COUNT_TOLERANCE * max(cached_estimate, 1)
+
+def fetch_data(cache):
+    """Fetch the file data from the database, unless the cache is still fresh.
+
+    Returns None if the cache can be kept, otherwise the file tree, a FileHashIndex of
+    the files, and the sorted paths of unique files.
+    """
+    try:
+        table_stats = fetch_table_stats()
+    except Exception:
+        if cache:
+            # The database is unreachable, so keep trusting the cache
+            return None
+        table_stats = None
+
+    if cache and is_cache_fresh(cache, table_stats):
+        return None
+
+    file_hash_index, file_hash_counts = fetch_all()
+    unique_files = find_unique_files(file_hash_index, file_hash_counts)
+    file_tree = build_tree(file_hash_index, file_hash_counts)
+    if file_hash_index:
+        row_count_estimate, modification_count = table_stats or (None, None)
+        # Save data to cache; the tree is cached too so a warm start need not rebuild it
+        save_cache({
+            "row_count_estimate": row_count_estimate,
+            "modification_count": modification_count,
+            "file_tree": file_tree,
+            "file_hash_index": file_hash_index,
+            "unique_files": unique_files
+        })
+
+    return file_tree, file_hash_index, unique_files
+
+def run_in_background(root, func, args, callback):
+    """Run func(*args) on a worker thread and hand the outcome to callback on the Tk thread.
+
+    Tk is not thread-safe, so the worker only puts its result on a queue, which the Tk
+    event loop polls. callback is called with the result and the exception raised, if any.
+    """
+    results = queue.Queue()
+
+    def worker():
+        try:
+            results.put((func(*args), None))
+        except Exception as e:
+            results.put((None, e))
+
+    def drain_queue():
+        try:
+            result, error = results.get_nowait()
+        except queue.Empty:
+            root.after(QUEUE_POLL_MS, drain_queue)
+            return
+        callback(result, error)
+
+    threading.Thread(target=worker, daemon=True).start()
+    root.after(QUEUE_POLL_MS, drain_queue)
+
+class VirtualListbox:
+    """A Listbox that only holds the rows currently in view.
+
+    Each Listbox insert is a Tcl call, so for long lists the rows are kept in a Python
+    list and only the visible slice is redrawn when the view moves or is resized.
+    """
+    def __init__(self, master, items):
+        self.items = items
+        self.top = 0
+        # Index into items of the selected row, kept across redraws
+        self.selected = None
+
+        self.listbox = tk.Listbox(master)
+        self.listbox.pack(fill="both", expand=True, side="left", padx=10, pady=10)
+
+        # Add scrollbar to Listbox
+        self.scrollbar = ttk.Scrollbar(master, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+
+        # Tk adds a pixel and the selection border above and below each Listbox row
+        linespace = tkfont.Font(root=master, font=self.listbox.cget("font")).metrics("linespace")
+        select_border = self.listbox.winfo_pixels(self.listbox.cget("selectborderwidth"))
+        self.row_height = linespace + 1 + 2 * select_border
+
+        self.listbox.bind("<Configure>", lambda event: self.redraw())
+        self.listbox.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.listbox.bind("<Button-4>", self.on_mouse_wheel)
+        self.listbox.bind("<Button-5>", self.on_mouse_wheel)
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+
+        # Keyboard navigation has to move through items, not just the rows loaded
+        self.listbox.bind("<Up>", lambda event: self.move_selection(-1))
+        self.listbox.bind("<Down>", lambda event: self.move_selection(1))
+        self.listbox.bind("<Prior>", lambda event: self.move_selection(-self.visible_rows()))
+        self.listbox.bind("<Next>", lambda event: self.move_selection(self.visible_rows()))
+        self.listbox.bind("<Home>", lambda event: self.select(0))
+        self.listbox.bind("<End>", lambda event: self.select(len(self.items) - 1))
+
+    def visible_rows(self):
+        """Number of rows that fit completely in the Listbox."""
+        border = self.listbox.winfo_pixels(self.listbox.cget("borderwidth"))
+        highlight = self.listbox.winfo_pixels(self.listbox.cget("highlightthickness"))
+        height = self.listbox.winfo_height() - 2 * (border + highlight)
+        return max(1, height // self.row_height)
+
+    def on_select(self, event):
+        """Remember which item was selected with the mouse."""
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.top + selection[0]
+
+    def move_selection(self, offset):
+        """Move the selection by a number of rows."""
+        if self.selected is None:
+            return self.select(self.top)
+        return self.select(self.selected + offset)
+
+    def select(self, index):
+        """Select an item, scrolling it into view."""
+        if not self.items:
+            return "break"
+        self.selected = max(0, min(index, len(self.items) - 1))
+        rows = self.visible_rows()
+        if self.selected < self.top:
+            self.top = self.selected
+        elif self.selected >= self.top + rows:
+            self.top = self.selected - rows + 1
+        self.redraw()
+        # Stop the Listbox from moving within its own contents
+        return "break"
+
+    def yview(self, *args):
+        """Move the view in response to the scrollbar."""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.items))
+        elif args[0] == "scroll":
+            step = self.visible_rows() if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.redraw()
+
+    def on_mouse_wheel(self, event):
+        """Scroll the view with the mouse wheel."""
+        if event.num == 4 or event.delta > 0:
+            self.top -= 3
+        else:
+            self.top += 3
+        self.redraw()
+        # Stop the Listbox from scrolling its own contents
+        return "break"
+
+    def redraw(self):
+        """Fill the Listbox with the rows in view and update the scrollbar."""
+        rows = self.visible_rows()
+        self.top = max(0, min(self.top, len(self.items) - rows))
+        self.listbox.delete(0, "end")
+        self.listbox.insert("end", *self.items[self.top:self.top + rows])
+        # Keep the first loaded row at the top in case the Listbox scrolled itself
+        self.listbox.yview_moveto(0)
+        if self.selected is not None and self.top <= self.selected < self.top + rows:
+            self.listbox.selection_set(self.selected - self.top)
+            self.listbox.activate(self.selected - self.top)
+        if self.items:
+            self.scrollbar.set(self.top / len(self.items), min(1.0, (self.top + rows) / len(self.items)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
 class FileTreeApp:
-    def __init__(self, root, file_tree, file_hash_counts, file_hashes):
+    def __init__(self, root, file_tree, file_hash_index, unique_files):
         self.root = root
-        self.file_hash_counts = file_hash_counts
-        self.file_hashes = file_hashes
+        self.file_tree = file_tree
+        self.file_hash_index = file_hash_index
+        self.unique_files = unique_files
+        self.unique_files_listbox = None
         self.root.title("File Tree Viewer")
         self.root.geometry("800x600")  # Set main window size to 800x600.
 
@@ -134,6 +524,7 @@ class FileTreeApp:
 
         # Bind events
         self.tree.bind("<Button-3>", self.show_context_menu)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
 
         # Configure TreeView styles
         style = ttk.Style()
@@ -141,49 +532,79 @@ class FileTreeApp:
         style.configure("Treeview.Item", background="white")
         style.map("Treeview.Item", background=[("selected", "blue")])
         style.configure("Treeview.Item.red", background="red")
-
-        # Populate the TreeView
-        self.populate_tree("", file_tree)
-
-    def populate_tree(self, parent, node):
-        """Recursively populate the TreeView with file tree data and apply highlights."""
-        for key, value in node.items():
-            item_id = self.tree.insert(parent, "end", text=key, values=(self.get_file_hash(self.get_full_path(parent, key)),), open=False)
-            if isinstance(value, dict):
-                self.populate_tree(item_id, value)
-
-                # Check if the folder contains any red-highlighted files
-                if self.is_folder_highlighted(item_id):
-                    self.tree.item(item_id, tags=(SINGLE_TAG,))
-            else:
-                # Highlight individual files if they have a unique hash
-                file_path = self.get_full_path(parent, key)
-                file_hash = self.get_file_hash(file_path)
-                if self.file_hash_counts.get(file_hash, 0) == 1:
-                    self.tree.item(item_id, tags=(SINGLE_TAG,))
-                    self.tree.tag_configure(SINGLE_TAG, background="red")
-
-    def is_folder_highlighted(self, folder_id):
-        """Check if a folder contains any red-highlighted files."""
-        children = self.tree.get_children(folder_id)
+        self.tree.tag_configure(SINGLE_TAG, background="red")
+
+        # Defined once so Tcl compiles it once, rather than on every folder open
+        self.tree.tk.eval(INSERT_ITEMS_SCRIPT)
+
+        # Folder nodes and paths whose contents are not yet in the TreeView, keyed by item id
+        self.unopened_folders = {}
+
+        # Populate the top level of the TreeView
+        self.populate_tree("", 0)
+
+    def set_data(self, file_tree, file_hash_index, unique_files):
+        """Replace the file data shown, such as when the cache turns out to be stale."""
+        self.file_tree = file_tree
+        self.file_hash_index = file_hash_index
+        self.unique_files = unique_files
+
+        self.tree.delete(*self.tree.get_children())
+        self.unopened_folders = {}
+        self.populate_tree("", 0)
+
+        # Refresh the Unique Files window if it is still open
+        listbox = self.unique_files_listbox
+        if listbox is not None and listbox.listbox.winfo_exists():
+            listbox.items = unique_files
+            listbox.selected = None
+            listbox.redraw()
+
+    def populate_tree(self, parent, node, path_prefix=""):
+        """Populate the TreeView with the children of a file tree node and apply highlights.
+
+        Folders get a placeholder child so they can be expanded; their contents are
+        inserted when they are first opened. path_prefix is the full path of parent.
+        """
+        file_tree = self.file_tree
+        children = range(file_tree.first_child[node], file_tree.child_end[node])
+        items = []
+        paths = []
         for child in children:
-            if SINGLE_TAG in self.tree.item(child, "tags"):
-                return True
-        return False
+            name = file_tree.names[child]
+            file_path = f"{path_prefix}/{name}"
+            # Highlight unique files and the folders containing them
+            tags = (SINGLE_TAG,) if file_tree.highlighted[child] else ()
+            items.extend((name, self.get_file_hash(file_path) or "", tags, file_tree.first_child[child] >= 0))
+            paths.append(file_path)
+
+        # Insert all of the siblings with a single call into Tcl
+        item_ids = self.tree.tk.splitlist(self.tree.tk.call(INSERT_ITEMS_PROC, self.tree, parent, tuple(items)))
+        for item_id, child, file_path in zip(item_ids, children, paths):
+            if file_tree.first_child[child] >= 0:
+                self.unopened_folders[item_id] = (child, file_path)
+
+    def on_tree_open(self, event):
+        """Insert the contents of a folder the first time it is opened."""
+        item_id = self.tree.focus()
+        if item_id not in self.unopened_folders:
+            return
+        node, folder_path = self.unopened_folders.pop(item_id)
+        self.tree.delete(*self.tree.get_children(item_id))
+        self.populate_tree(item_id, node, folder_path)
 
-    def get_full_path(self, parent, item_text):
+    def get_full_path(self, item_id):
         """Construct the full path of the selected file."""
         path_parts = []
-        current_item = parent
+        current_item = item_id
         while current_item:
-            path_parts.insert(0, self.tree.item(current_item, "text"))
+            path_parts.append(self.tree.item(current_item, "text"))
             current_item = self.tree.parent(current_item)
-        path_parts.append(item_text)
-        return "/" + "/".join(path_parts)
+        return "/" + "/".join(reversed(path_parts))
 
     def get_file_hash(self, file_path):
-        """Fetch the hash of a file given its path from the precached dictionary."""
-        return self.file_hashes.get(file_path, None)
+        """Fetch the hash of a file given its path from the precached index."""
+        return self.file_hash_index.get(file_path, None)
 
     def show_context_menu(self, event):
         """Display the context menu on right-click."""
@@ -201,14 +622,14 @@ class FileTreeApp:
         # Get the full path of the selected file
         file_path = self.get_full_path(selected_item[0])
 
-        # Fetch files with the same hash
-        files = fetch_files_with_same_hash(file_path)
-
-        # Display the result in a new window
+        # Open the window right away and fill it in once the query returns
         new_window = tk.Toplevel(self.root)
         new_window.title(f"Files with the Same Hash as: {file_path}")
         new_window.geometry("600x400")  # Set pop-up window size to 600x400
 
+        loading_label = ttk.Label(new_window, text="Loading\u2026")
+        loading_label.pack(side="top", anchor="w", padx=10, pady=(10, 0))
+
         listbox = tk.Listbox(new_window)
         listbox.pack(fill="both", expand=True, side="left", padx=10, pady=10)
 
@@ -217,61 +638,92 @@ class FileTreeApp:
         listbox.configure(yscrollcommand=listbox_scrollbar.set)
         listbox_scrollbar.pack(side="right", fill="y")
 
-        for file in files:
-            listbox.insert("end", file)
+        def show_files(files, error):
+            if not new_window.winfo_exists():
+                return
+            loading_label.destroy()
+            if error:
+                messagebox.showerror("Database Error", f"Error: {error}", parent=new_window)
+                return
+            for file in files:
+                listbox.insert("end", file)
+
+        # Fetch files with the same hash
+        run_in_background(self.root, fetch_files_with_same_hash, (file_path,), show_files)
 
     def show_unique_files(self):
         """Open a new window listing all files with only a single copy."""
-        unique_files = sorted([path for path, hash in self.file_hashes.items() if self.file_hash_counts.get(hash, 0) == 1])
-
         # Display the result in a new window
         new_window = tk.Toplevel(self.root)
         new_window.title("Unique Files")
         new_window.geometry("600x400")  # Set pop-up window size to 600x400
 
-        listbox = tk.Listbox(new_window)
-        listbox.pack(fill="both", expand=True, side="left", padx=10, pady=10)
+        # The list can be very long, so only the rows in view are put in the Listbox
+        self.unique_files_listbox = VirtualListbox(new_window, self.unique_files)
 
-        # Add scrollbar to Listbox
-        listbox_scrollbar = ttk.Scrollbar(new_window, orient="vertical", command=listbox.yview)
-        listbox.configure(yscrollcommand=listbox_scrollbar.set)
-        listbox_scrollbar.pack(side="right", fill="y")
+def main():
+    # Create the GUI
+    root = tk.Tk()
 
-        for file in unique_files:
-            listbox.insert("end", file)
+    def on_close():
+        # The loading thread is a daemon, so let a cache save finish before exiting
+        if _CACHE_LOCK.locked():
+            root.withdraw()
+            root.after(QUEUE_POLL_MS, on_close)
+            return
+        close_db_pool()
+        root.destroy()
 
-def main():
-    # Load cached data
-    cache = load_cache()
-    if cache:
-        file_paths = cache.get("file_paths", [])
-        file_hash_counts = cache.get("file_hash_counts", {})
-        file_hashes = cache.get("file_hashes", {})
-    else:
-        # Fetch data from the database
-        file_paths = fetch_file_paths()
-        if not file_paths:
+    root.protocol("WM_DELETE_WINDOW", on_close)
+
+    # Show a progress indicator while the data loads in the background
+    loading_frame = ttk.Frame(root, padding=20)
+    loading_frame.pack(fill="both", expand=True)
+    ttk.Label(loading_frame, text="Loading file index\u2026").pack(side="top", anchor="w")
+    progress = ttk.Progressbar(loading_frame, mode="indeterminate", length=300)
+    progress.pack(side="top", fill="x", pady=(10, 0))
+    progress.start()
+
+    app = None
+
+    def show_data(file_tree, file_hash_index, unique_files):
+        nonlocal app
+        if app is not None:
+            app.set_data(file_tree, file_hash_index, unique_files)
             return
 
-        file_hash_counts = fetch_file_hash_counts()
-        file_hashes = fetch_all_file_hashes()
+        loading_frame.destroy()
+        app = FileTreeApp(root, file_tree, file_hash_index, unique_files)
 
-        # Save data to cache
-        save_cache({
-            "file_paths": file_paths,
-            "file_hash_counts": file_hash_counts,
-            "file_hashes": file_hashes
-        })
+        # Show the window listing all unique files at startup
+        app.show_unique_files()
 
-    file_tree = build_tree(file_paths)
+    def on_fetched(data, error):
+        if error:
+            messagebox.showerror("Database Error", f"Error: {error}")
+            if app is None:
+                on_close()
+            return
+        if data is None:
+            # The cache is still fresh
+            return
+
+        file_tree, file_hash_index, unique_files = data
+        if not file_hash_index and app is None:
+            on_close()
+            return
+        show_data(file_tree, file_hash_index, unique_files)
+
+    def on_cache_loaded(cache, error):
+        # Show cached data straight away, without waiting for the database
+        if cache:
+            show_data(cache["file_tree"], cache["file_hash_index"], cache["unique_files"])
+
+        # Then check the cache against the database and reload if the table changed
+        run_in_background(root, fetch_data, (cache,), on_fetched)
+
+    run_in_background(root, load_cache, (), on_cache_loaded)
 
-    # Create the GUI
-    root = tk.Tk()
-    app = FileTreeApp(root, file_tree, file_hash_counts, file_hashes)
-    
-    # Show the window listing all unique files at startup
-    app.show_unique_files()
-    
     root.mainloop()
 
 if __name__ == "__main__":
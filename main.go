@@ -29,6 +29,17 @@ CREATE TABLE IF NOT EXISTS file_hashes (
 );
 `
 
+// CONCURRENTLY cannot run inside a transaction block, so this is executed on its own.
+const createHashIndexQuery = `CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_file_hashes_hash ON file_hashes (hash);`
+
+// An interrupted concurrent build leaves the index behind but marked invalid.
+const hashIndexValidQuery = `SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('idx_file_hashes_hash');`
+
+const dropHashIndexQuery = `DROP INDEX CONCURRENTLY IF EXISTS idx_file_hashes_hash;`
+
+// Keeps planner statistics and the visibility map current so hash lookups and counts can use index-only scans.
+const vacuumAnalyzeQuery = `VACUUM ANALYZE file_hashes;`
+
 type Config struct {
 	Directory      string
 	DbName         string
@@ -189,6 +200,11 @@ func main() {
 		log.Fatalf("Failed to create table: %v", err)
 	}
 
+	log.Printf("Creating hash index if it doesn't exist")
+	if err := ensureHashIndex(db); err != nil {
+		log.Fatalf("Failed to create hash index: %v", err)
+	}
+
 	writer, outputFile := createOutputWriter(cfg.OutputFile)
 	defer func() {
 		writer.Flush()
@@ -198,9 +214,33 @@ func main() {
 	writerMutex := &sync.Mutex{}
 	processDirectory(cfg, db, writer, writerMutex)
 
+	log.Printf("Vacuuming and analyzing file_hashes")
+	if _, err := db.Exec(vacuumAnalyzeQuery); err != nil {
+		log.Printf("Failed to vacuum file_hashes: %v", err)
+	}
+
 	log.Printf("MD5 hash calculation and storage completed. Results saved to %s", cfg.OutputFile)
 }
 
+func ensureHashIndex(db *sql.DB) error {
+	var valid bool
+	err := db.QueryRow(hashIndexValidQuery).Scan(&valid)
+	if err == nil && valid {
+		return nil
+	}
+	if err == nil {
+		// IF NOT EXISTS would skip an invalid index, so rebuild it
+		log.Printf("Dropping invalid hash index")
+		if _, err := db.Exec(dropHashIndexQuery); err != nil {
+			return err
+		}
+	} else if !errors.Is(err, sql.ErrNoRows) {
+		return err
+	}
+	_, err = db.Exec(createHashIndexQuery)
+	return err
+}
+
 func processFile(path, storedPath string, db *sql.DB, force bool) (string, int64, string, error) {
 	// Open the file for reading
 	file, err := os.Open(path)
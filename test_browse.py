@@ -0,0 +1,190 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import browse
+
+MD5_A = "aa" * 16
+MD5_B = "bb" * 16
+MD5_C = "cc" * 16
+
+
+def make_index(file_hashes):
+    """Build a FileHashIndex from a dictionary of file path to hex hash."""
+    file_hash_index = browse.FileHashIndex()
+    for path in sorted(file_hashes):
+        file_hash_index.add(path, file_hashes[path])
+    return file_hash_index
+
+
+def children(file_tree, node):
+    """Names of the children of a file tree node."""
+    return [file_tree.names[child] for child in range(file_tree.first_child[node], file_tree.child_end[node])]
+
+
+def find_node(file_tree, path):
+    """Index of the node at the given path."""
+    node = 0
+    for part in path.strip("/").split("/"):
+        for child in range(file_tree.first_child[node], file_tree.child_end[node]):
+            if file_tree.names[child] == part:
+                node = child
+                break
+        else:
+            raise KeyError(path)
+    return node
+
+
+class TestBuildTree:
+    def build(self, file_hashes):
+        file_hash_index = make_index(file_hashes)
+        return browse.build_tree(file_hash_index, file_hash_index.count_digests())
+
+    def test_children_are_contiguous_and_breadth_first(self):
+        file_tree = self.build({
+            "/a/b/c.txt": MD5_A,
+            "/a/d.txt": MD5_B,
+            "/e/f.txt": MD5_B,
+            "/g.txt": MD5_C,
+        })
+        assert children(file_tree, 0) == ["a", "e", "g.txt"]
+        assert children(file_tree, find_node(file_tree, "/a")) == ["b", "d.txt"]
+        assert children(file_tree, find_node(file_tree, "/a/b")) == ["c.txt"]
+        for node in range(1, len(file_tree.names)):
+            assert file_tree.parent_idx[node] < node
+            parent = file_tree.parent_idx[node]
+            assert file_tree.first_child[parent] <= node < file_tree.child_end[parent]
+
+    def test_files_have_no_children(self):
+        file_tree = self.build({"/a/b.txt": MD5_A})
+        assert file_tree.first_child[find_node(file_tree, "/a/b.txt")] == -1
+
+    def test_components_sort_before_longer_names(self):
+        # "a.b" sorts before "a/" as a string, but "a" comes first as a component
+        file_tree = self.build({"/a.b/x": MD5_A, "/a/y": MD5_B})
+        assert children(file_tree, 0) == ["a", "a.b"]
+
+    def test_file_sharing_a_folder_name_is_skipped(self):
+        file_tree = self.build({"/e": MD5_A, "/e/f.txt": MD5_B})
+        assert children(file_tree, 0) == ["e"]
+        assert children(file_tree, find_node(file_tree, "/e")) == ["f.txt"]
+
+    def test_unique_files_highlight_their_folders(self):
+        file_tree = self.build({
+            "/a/b/c.txt": MD5_A,
+            "/a/d.txt": MD5_B,
+            "/e/f.txt": MD5_B,
+            "/g.txt": MD5_C,
+        })
+        highlighted = {path for path in ["/a", "/a/b", "/a/b/c.txt", "/a/d.txt", "/e", "/e/f.txt", "/g.txt"]
+                       if file_tree.highlighted[find_node(file_tree, path)]}
+        assert highlighted == {"/a", "/a/b", "/a/b/c.txt", "/g.txt"}
+
+    def test_empty(self):
+        file_tree = self.build({})
+        assert file_tree.names == [""]
+        assert children(file_tree, 0) == []
+
+
+class TestUnescapeCopyField:
+    def test_plain_field_is_unchanged(self):
+        assert browse.unescape_copy_field("/a/b.txt") == "/a/b.txt"
+
+    def test_escapes(self):
+        assert browse.unescape_copy_field(r"a\tb\nc\rd\\e") == "a\tb\nc\rd\\e"
+        assert browse.unescape_copy_field(r"\b\f\v") == "\b\f\v"
+
+    def test_unknown_escape_keeps_character(self):
+        assert browse.unescape_copy_field(r"\x") == "x"
+
+
+class TestFileHashCopyReader:
+    def test_rows_split_across_writes(self):
+        reader = browse.FileHashCopyReader()
+        reader.write(f"/a\t{MD5_A}\n/b")
+        reader.write(f"\t{MD5_B}")
+        reader.write(f"\n/c\\tx\t{MD5_C}\n")
+        file_hash_index = reader.file_hash_index
+        assert file_hash_index.paths == ["/a", "/b", "/c\tx"]
+        assert file_hash_index.get("/b") == MD5_B
+        assert reader.partial_line == ""
+
+    def test_write_returns_length(self):
+        reader = browse.FileHashCopyReader()
+        data = f"/a\t{MD5_A}\n"
+        assert reader.write(data) == len(data)
+
+
+class TestFileHashIndex:
+    def test_find_and_get(self):
+        file_hash_index = make_index({"/a": MD5_A, "/b": MD5_B})
+        assert len(file_hash_index) == 2
+        assert file_hash_index.find("/b") == 1
+        assert file_hash_index.find("/c") == -1
+        assert file_hash_index.get("/a") == MD5_A
+        assert file_hash_index.get("/c") is None
+        assert file_hash_index.get("/c", "") == ""
+
+    def test_count_digests(self):
+        file_hash_index = make_index({"/a": MD5_A, "/b": MD5_A, "/c": MD5_B})
+        counts = file_hash_index.count_digests()
+        assert counts[bytes.fromhex(MD5_A)] == 2
+        assert counts[bytes.fromhex(MD5_B)] == 1
+
+    def test_rejects_unsorted_paths(self):
+        file_hash_index = make_index({"/b": MD5_A})
+        with pytest.raises(ValueError):
+            file_hash_index.add("/a", MD5_B)
+
+    def test_rejects_wrong_digest_size(self):
+        file_hash_index = browse.FileHashIndex()
+        with pytest.raises(ValueError):
+            file_hash_index.add("/a", "abcd")
+
+    def test_find_unique_files(self):
+        file_hash_index = make_index({"/a": MD5_A, "/b": MD5_A, "/c": MD5_B})
+        unique_files = browse.find_unique_files(file_hash_index, file_hash_index.count_digests())
+        assert unique_files == ["/c"]
+
+
+class TestIsCacheFresh:
+    cache = {"row_count_estimate": 1000, "modification_count": 5}
+
+    def test_unchanged(self):
+        assert browse.is_cache_fresh(self.cache, (1000, 5))
+
+    def test_estimate_within_tolerance(self):
+        assert browse.is_cache_fresh(self.cache, (1005, 5))
+
+    def test_estimate_outside_tolerance(self):
+        assert not browse.is_cache_fresh(self.cache, (1020, 5))
+
+    def test_modified(self):
+        assert not browse.is_cache_fresh(self.cache, (1000, 6))
+
+    def test_missing_estimate(self):
+        assert not browse.is_cache_fresh({"modification_count": 5}, (1000, 5))
+
+    def test_missing_statistics(self):
+        cache = {"row_count_estimate": 0, "modification_count": None}
+        assert browse.is_cache_fresh(cache, (0, None))
+
+
+class TestCache:
+    @pytest.fixture(autouse=True)
+    def cache_file(self, tmp_path, monkeypatch):
+        path = tmp_path / "cache.pickle.z"
+        monkeypatch.setattr(browse, "CACHE_FILE", str(path))
+        return path
+
+    def test_round_trip(self):
+        browse.save_cache({"unique_files": ["/a"]})
+        assert browse.load_cache()["unique_files"] == ["/a"]
+
+    def test_missing_cache(self):
+        assert browse.load_cache() is None
+
+    @pytest.mark.parametrize("contents", [b"", b"not a cache"])
+    def test_bad_cache(self, cache_file, contents):
+        cache_file.write_bytes(contents)
+        assert browse.load_cache() is None